@@ -0,0 +1,46 @@
+"""Tests for the lexer used by Tools/cases_generator."""
+
+import unittest
+
+from test.test_tools import imports_under_tool, skip_if_missing
+
+skip_if_missing('cases_generator')
+with imports_under_tool('cases_generator'):
+    import lexer
+
+
+def tokens(src):
+    return [(tkn.kind, tkn.text, tkn.begin, tkn.end)
+            for tkn in lexer.tokenize(src)]
+
+
+class TestLexer(unittest.TestCase):
+
+    def test_blanks_are_skipped(self):
+        self.assertEqual(tokens(" x \t=\f1\v;\r\n  y"), [
+            ('IDENTIFIER', 'x', (1, 2), (1, 3)),
+            ('EQUALS', '=', (1, 5), (1, 6)),
+            ('NUMBER', '1', (1, 7), (1, 8)),
+            ('SEMI', ';', (1, 9), (1, 10)),
+            ('IDENTIFIER', 'y', (2, 3), (2, 4)),
+        ])
+
+    def test_trailing_blanks(self):
+        # A run of blanks not followed by a token must be consumed in
+        # linear time; this used to take minutes.
+        for n in (1, 10, 100_000):
+            with self.subTest(n=n):
+                self.assertEqual(tokens("x" + " " * n),
+                                 [('IDENTIFIER', 'x', (1, 1), (1, 2))])
+                self.assertEqual(tokens("x" + "\t" * n + "\n"),
+                                 [('IDENTIFIER', 'x', (1, 1), (1, 2))])
+
+    def test_blanks_before_non_ascii_space(self):
+        self.assertEqual(tokens("a" + " " * 100_000 + "\xa0b"), [
+            ('IDENTIFIER', 'a', (1, 1), (1, 2)),
+            ('IDENTIFIER', 'b', (1, 100_003), (1, 100_004)),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
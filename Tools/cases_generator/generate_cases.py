@@ -326,7 +326,7 @@ def parse(self) -> None:
         while tkn := psr.next(raw=True):
             if tkn.text == END_MARKER:
                 break
-        del psr.tokens[psr.getpos() - 1 :]
+        psr.truncate(psr.getpos() - 1)
 
         # Parse from start
         psr.setpos(start)
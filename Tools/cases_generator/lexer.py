@@ -113,7 +113,10 @@ def choice(*opts):
 
 newline = r"\n"
 invalid = r"\S"  # A single non-space character that's not caught by any of the other patterns
-matcher = re.compile(choice(id_re, number_re, str_re, char, newline, macro, comment_re, *operators.values(), invalid))
+# Runs of horizontal whitespace are matched (and then skipped) as a whole;
+# otherwise finditer() tries every other alternative at each blank.
+whitespace = r"[ \t\f\r\v]+"
+matcher = re.compile(choice(whitespace, id_re, number_re, str_re, char, newline, macro, comment_re, *operators.values(), invalid))
 letter = re.compile(r'[a-zA-Z_]')
 
 kwds = (
@@ -181,6 +184,8 @@ def tokenize(src, line=1, filename=None):
     for m in matcher.finditer(src):
         start, end = m.span()
         text = m.group(0)
+        if text[0] in ' \t\f\r\v':
+            continue
         if text in keywords:
             kind = keywords[text]
         elif letter.match(text):
@@ -1,9 +1,26 @@
 """Parser for bytecodes.inst."""
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import NamedTuple, Callable, TypeVar, Literal
 
 import lexer as lx
+# Token kinds, imported by name to save an attribute lookup per use
+from lexer import (
+    COMMA,
+    DIVIDE,
+    EQUALS,
+    IDENTIFIER,
+    LBRACE,
+    LBRACKET,
+    LPAREN,
+    MINUSMINUS,
+    NUMBER,
+    PLUS,
+    RBRACE,
+    RBRACKET,
+    RPAREN,
+    SEMI,
+)
 from plexer import PLexer
 
 
@@ -15,13 +32,14 @@ def contextual(func: Callable[[P], N | None]) -> Callable[[P], N | None]:
     # Decorator to wrap grammar methods.
     # Resets position if `func` returns None.
     def contextual_wrapper(self: P) -> N | None:
-        begin = self.getpos()
+        begin = self.pos
         res = func(self)
         if res is None:
-            self.setpos(begin)
-            return
-        end = self.getpos()
-        res.context = Context(begin, end, self)
+            self.pos = begin
+            return None
+        res.ctx_begin = begin
+        res.ctx_end = self.pos
+        res.ctx_owner = self
         return res
 
     return contextual_wrapper
@@ -36,42 +54,55 @@ def __repr__(self):
         return f"<{self.begin}-{self.end}>"
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class Node:
-    context: Context | None = field(init=False, default=None)
+    # The node's token range, stored unboxed to save a Context per node
+    ctx_begin: int = field(init=False, default=-1, repr=False)
+    ctx_end: int = field(init=False, default=-1, repr=False)
+    ctx_owner: PLexer | None = field(init=False, default=None, repr=False)
+
+    def __repr__(self) -> str:
+        # Show the range as context=<begin-end>, like when it was a field;
+        # subclasses pass repr=False so they inherit this.
+        args = [f"context={self.context!r}"]
+        args += [f"{f.name}={getattr(self, f.name)!r}" for f in fields(self) if f.repr]
+        return f"{type(self).__name__}({', '.join(args)})"
+
+    @property
+    def context(self) -> Context | None:
+        if self.ctx_owner is None:
+            return None
+        return Context(self.ctx_begin, self.ctx_end, self.ctx_owner)
 
     @property
     def text(self) -> str:
         return self.to_text()
 
     def to_text(self, dedent: int = 0) -> str:
-        context = self.context
-        if not context:
+        owner = self.ctx_owner
+        if owner is None:
             return ""
-        tokens = context.owner.tokens
-        begin = context.begin
-        end = context.end
-        return lx.to_text(tokens[begin:end], dedent)
+        return lx.to_text(owner.tokens[self.ctx_begin : self.ctx_end], dedent)
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class Block(Node):
     tokens: list[lx.Token]
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class StackEffect(Node):
     name: str
     # TODO: type, condition
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class CacheEffect(Node):
     name: str
     size: int
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class OpName(Node):
     name: str
 
@@ -81,7 +112,7 @@ class OpName(Node):
 UOp = OpName | CacheEffect
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class InstHeader(Node):
     kind: Literal["inst", "op"]
     name: str
@@ -89,7 +120,7 @@ class InstHeader(Node):
     outputs: list[OutputEffect]
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class InstDef(Node):
     kind: Literal["inst", "op"]
     name: str
@@ -98,36 +129,44 @@ class InstDef(Node):
     block: Block
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class Super(Node):
     name: str
     ops: list[OpName]
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class Macro(Node):
     name: str
     uops: list[UOp]
 
 
-@dataclass
+@dataclass(slots=True, repr=False)
 class Family(Node):
     name: str
     size: str  # Variable giving the cache size in code units
     members: list[str]
 
 
+Definition = InstDef | Super | Macro | Family
+
+
+OPENERS = frozenset({LBRACE, LPAREN, LBRACKET})
+CLOSERS = frozenset({RBRACE, RPAREN, RBRACKET})
+
+
 class Parser(PLexer):
-    @contextual
-    def definition(self) -> InstDef | Super | Macro | Family | None:
-        if inst := self.inst_def():
-            return inst
-        if super := self.super_def():
-            return super
-        if macro := self.macro_def():
-            return macro
-        if family := self.family_def():
-            return family
+    __slots__ = ()
+
+    def definition(self) -> Definition | None:
+        # Dispatch on the leading keyword instead of trying each rule.
+        # Not @contextual: the rule we dispatch to sets the same context.
+        here = self.pos
+        tkn = self.expect(IDENTIFIER)
+        self.pos = here
+        if tkn and (rule := DEFINITION_KEYWORDS.get(tkn.text)):
+            return rule(self)
+        return None
 
     @contextual
     def inst_def(self) -> InstDef | None:
@@ -143,197 +182,224 @@ def inst_header(self) -> InstHeader | None:
         #   | inst(NAME, (inputs -- outputs))
         #   | op(NAME, (inputs -- outputs))
         # TODO: Make INST a keyword in the lexer.
-        if (tkn := self.expect(lx.IDENTIFIER)) and (kind := tkn.text) in ("inst", "op"):
-            if self.expect(lx.LPAREN) and (tkn := self.expect(lx.IDENTIFIER)):
+        if (tkn := self.expect(IDENTIFIER)) and (kind := tkn.text) in ("inst", "op"):
+            if self.expect(LPAREN) and (tkn := self.expect(IDENTIFIER)):
                 name = tkn.text
-                if self.expect(lx.COMMA):
+                if self.expect(COMMA):
                     inp, outp = self.stack_effect()
-                    if self.expect(lx.RPAREN):
-                        if (tkn := self.peek()) and tkn.kind == lx.LBRACE:
+                    if self.expect(RPAREN):
+                        if (tkn := self.peek()) and tkn.kind == LBRACE:
                             return InstHeader(kind, name, inp, outp)
-                elif self.expect(lx.RPAREN) and kind == "inst":
+                elif self.expect(RPAREN) and kind == "inst":
                     # No legacy stack effect if kind is "op".
                     return InstHeader(kind, name, [], [])
         return None
 
     def stack_effect(self) -> tuple[list[InputEffect], list[OutputEffect]]:
         # '(' [inputs] '--' [outputs] ')'
-        if self.expect(lx.LPAREN):
+        if self.expect(LPAREN):
             inputs = self.inputs() or []
-            if self.expect(lx.MINUSMINUS):
+            if self.expect(MINUSMINUS):
                 outputs = self.outputs() or []
-                if self.expect(lx.RPAREN):
+                if self.expect(RPAREN):
                     return inputs, outputs
         raise self.make_syntax_error("Expected stack effect")
 
     def inputs(self) -> list[InputEffect] | None:
         # input (',' input)*
-        here = self.getpos()
+        here = self.pos
         if inp := self.input():
-            near = self.getpos()
-            if self.expect(lx.COMMA):
-                if rest := self.inputs():
-                    return [inp] + rest
-            self.setpos(near)
-            return [inp]
-        self.setpos(here)
+            inputs = [inp]
+            while True:
+                near = self.pos
+                if not (self.expect(COMMA) and (inp := self.input())):
+                    self.pos = near
+                    break
+                inputs.append(inp)
+            return inputs
+        self.pos = here
         return None
 
     @contextual
     def input(self) -> InputEffect | None:
         # IDENTIFIER '/' INTEGER (CacheEffect)
         # IDENTIFIER (StackEffect)
-        if tkn := self.expect(lx.IDENTIFIER):
-            if self.expect(lx.DIVIDE):
-                if num := self.expect(lx.NUMBER):
-                    try:
-                        size = int(num.text)
-                    except ValueError:
+        if tkn := self.expect(IDENTIFIER):
+            if self.expect(DIVIDE):
+                if num := self.expect(NUMBER):
+                    if not num.text.isdigit():
                         raise self.make_syntax_error(
                             f"Expected integer, got {num.text!r}"
                         )
-                    else:
-                        return CacheEffect(tkn.text, size)
+                    return CacheEffect(tkn.text, int(num.text))
                 raise self.make_syntax_error("Expected integer")
             else:
                 # TODO: Arrays, conditions
                 return StackEffect(tkn.text)
+        return None
 
     def outputs(self) -> list[OutputEffect] | None:
         # output (, output)*
-        here = self.getpos()
+        here = self.pos
         if outp := self.output():
-            near = self.getpos()
-            if self.expect(lx.COMMA):
-                if rest := self.outputs():
-                    return [outp] + rest
-            self.setpos(near)
-            return [outp]
-        self.setpos(here)
+            outputs = [outp]
+            while True:
+                near = self.pos
+                if not (self.expect(COMMA) and (outp := self.output())):
+                    self.pos = near
+                    break
+                outputs.append(outp)
+            return outputs
+        self.pos = here
         return None
 
     @contextual
     def output(self) -> OutputEffect | None:
-        if tkn := self.expect(lx.IDENTIFIER):
+        if tkn := self.expect(IDENTIFIER):
             return StackEffect(tkn.text)
+        return None
 
     @contextual
     def super_def(self) -> Super | None:
-        if (tkn := self.expect(lx.IDENTIFIER)) and tkn.text == "super":
-            if self.expect(lx.LPAREN):
-                if tkn := self.expect(lx.IDENTIFIER):
-                    if self.expect(lx.RPAREN):
-                        if self.expect(lx.EQUALS):
+        if (tkn := self.expect(IDENTIFIER)) and tkn.text == "super":
+            if self.expect(LPAREN):
+                if tkn := self.expect(IDENTIFIER):
+                    if self.expect(RPAREN):
+                        if self.expect(EQUALS):
                             if ops := self.ops():
-                                self.require(lx.SEMI)
+                                self.require(SEMI)
                                 res = Super(tkn.text, ops)
                                 return res
+        return None
 
     def ops(self) -> list[OpName] | None:
         if op := self.op():
             ops = [op]
-            while self.expect(lx.PLUS):
+            while self.expect(PLUS):
                 if op := self.op():
                     ops.append(op)
             return ops
+        return None
 
     @contextual
     def op(self) -> OpName | None:
-        if tkn := self.expect(lx.IDENTIFIER):
+        if tkn := self.expect(IDENTIFIER):
             return OpName(tkn.text)
+        return None
 
     @contextual
     def macro_def(self) -> Macro | None:
-        if (tkn := self.expect(lx.IDENTIFIER)) and tkn.text == "macro":
-            if self.expect(lx.LPAREN):
-                if tkn := self.expect(lx.IDENTIFIER):
-                    if self.expect(lx.RPAREN):
-                        if self.expect(lx.EQUALS):
+        if (tkn := self.expect(IDENTIFIER)) and tkn.text == "macro":
+            if self.expect(LPAREN):
+                if tkn := self.expect(IDENTIFIER):
+                    if self.expect(RPAREN):
+                        if self.expect(EQUALS):
                             if uops := self.uops():
-                                self.require(lx.SEMI)
+                                self.require(SEMI)
                                 res = Macro(tkn.text, uops)
                                 return res
+        return None
 
     def uops(self) -> list[UOp] | None:
         if uop := self.uop():
             uops = [uop]
-            while self.expect(lx.PLUS):
+            while self.expect(PLUS):
                 if uop := self.uop():
                     uops.append(uop)
                 else:
                     raise self.make_syntax_error("Expected op name or cache effect")
             return uops
+        return None
 
     @contextual
     def uop(self) -> UOp | None:
-        if tkn := self.expect(lx.IDENTIFIER):
-            if self.expect(lx.DIVIDE):
-                if num := self.expect(lx.NUMBER):
-                    try:
-                        size = int(num.text)
-                    except ValueError:
+        if tkn := self.expect(IDENTIFIER):
+            if self.expect(DIVIDE):
+                if num := self.expect(NUMBER):
+                    if not num.text.isdigit():
                         raise self.make_syntax_error(
                             f"Expected integer, got {num.text!r}"
                         )
-                    else:
-                        return CacheEffect(tkn.text, size)
+                    return CacheEffect(tkn.text, int(num.text))
                 raise self.make_syntax_error("Expected integer")
             else:
                 return OpName(tkn.text)
+        return None
 
     @contextual
     def family_def(self) -> Family | None:
-        if (tkn := self.expect(lx.IDENTIFIER)) and tkn.text == "family":
+        if (tkn := self.expect(IDENTIFIER)) and tkn.text == "family":
             size = None
-            if self.expect(lx.LPAREN):
-                if tkn := self.expect(lx.IDENTIFIER):
-                    if self.expect(lx.COMMA):
-                        if not (size := self.expect(lx.IDENTIFIER)):
+            if self.expect(LPAREN):
+                if tkn := self.expect(IDENTIFIER):
+                    if self.expect(COMMA):
+                        if not (size := self.expect(IDENTIFIER)):
                             raise self.make_syntax_error("Expected identifier")
-                    if self.expect(lx.RPAREN):
-                        if self.expect(lx.EQUALS):
-                            if not self.expect(lx.LBRACE):
+                    if self.expect(RPAREN):
+                        if self.expect(EQUALS):
+                            if not self.expect(LBRACE):
                                 raise self.make_syntax_error("Expected {")
                             if members := self.members():
-                                if self.expect(lx.RBRACE) and self.expect(lx.SEMI):
+                                if self.expect(RBRACE) and self.expect(SEMI):
                                     return Family(
                                         tkn.text, size.text if size else "", members
                                     )
         return None
 
     def members(self) -> list[str] | None:
-        here = self.getpos()
-        if tkn := self.expect(lx.IDENTIFIER):
+        here = self.pos
+        if tkn := self.expect(IDENTIFIER):
             members = [tkn.text]
-            while self.expect(lx.COMMA):
-                if tkn := self.expect(lx.IDENTIFIER):
+            while self.expect(COMMA):
+                if tkn := self.expect(IDENTIFIER):
                     members.append(tkn.text)
                 else:
                     break
             peek = self.peek()
-            if not peek or peek.kind != lx.RBRACE:
+            if not peek or peek.kind != RBRACE:
                 raise self.make_syntax_error("Expected comma or right paren")
             return members
-        self.setpos(here)
+        self.pos = here
         return None
 
-    @contextual
     def block(self) -> Block:
-        tokens = self.c_blob()
-        return Block(tokens)
+        # Like @contextual, inlined; this never fails so never backtracks
+        begin = self.pos
+        res = Block(self.c_blob())
+        res.ctx_begin = begin
+        res.ctx_end = self.pos
+        res.ctx_owner = self
+        return res
 
     def c_blob(self) -> list[lx.Token]:
-        tokens: list[lx.Token] = []
+        tokens = self.tokens
+        kinds = self.kinds
+        begin = pos = self.pos
+        # Scan the token kinds directly for the closing bracket,
+        # then slice out everything before it in one go.
         level = 0
-        while tkn := self.next(raw=True):
-            if tkn.kind in (lx.LBRACE, lx.LPAREN, lx.LBRACKET):
+        while pos < len(kinds):
+            kind = kinds[pos]
+            pos += 1
+            if kind in OPENERS:
                 level += 1
-            elif tkn.kind in (lx.RBRACE, lx.RPAREN, lx.RBRACKET):
+            elif kind in CLOSERS:
                 level -= 1
                 if level <= 0:
-                    break
-            tokens.append(tkn)
-        return tokens
+                    self.pos = pos
+                    return tokens[begin : pos - 1]
+        self.pos = pos
+        return tokens[begin:pos]
+
+
+# Maps the leading keyword of a definition to the rule parsing it
+DEFINITION_KEYWORDS: dict[str, Callable[[Parser], Definition | None]] = {
+    "inst": Parser.inst_def,
+    "op": Parser.inst_def,
+    "super": Parser.super_def,
+    "macro": Parser.macro_def,
+    "family": Parser.family_def,
+}
 
 
 if __name__ == "__main__":
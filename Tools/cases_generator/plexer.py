@@ -3,14 +3,18 @@
 
 
 class PLexer:
-    def __init__(self, src: str, filename: str):
+    __slots__ = ("src", "filename", "tokens", "kinds", "pos")
+
+    def __init__(self, src: str, filename: str) -> None:
         self.src = src
         self.filename = filename
         self.tokens = list(lx.tokenize(self.src, filename=filename))
+        # Parallel to self.tokens, so scanning needn't touch Token objects
+        self.kinds = [tkn.kind for tkn in self.tokens]
         self.pos = 0
 
     def getpos(self) -> int:
-        # Current position
+        # Current position (the parser reads self.pos directly)
         return self.pos
 
     def eof(self) -> bool:
@@ -18,10 +22,15 @@ def eof(self) -> bool:
         return self.pos >= len(self.tokens)
 
     def setpos(self, pos: int) -> None:
-        # Reset position
+        # Reset position (the parser assigns self.pos directly)
         assert 0 <= pos <= len(self.tokens), (pos, len(self.tokens))
         self.pos = pos
 
+    def truncate(self, pos: int) -> None:
+        # Drop all tokens from position `pos` onward
+        del self.tokens[pos:]
+        del self.kinds[pos:]
+
     def backup(self) -> None:
         # Back up position by 1
         assert self.pos > 0
@@ -52,11 +61,19 @@ def maybe(self, kind: str, raw: bool = False) -> Token | None:
 
     def expect(self, kind: str) -> Token | None:
         # Return next token and advance position if kind matches
-        tkn = self.next()
-        if tkn is not None:
-            if tkn.kind == kind:
-                return tkn
-            self.backup()
+        # (Equivalent to next() followed by backup() on mismatch,
+        # but inlined since this is the parser's innermost call.)
+        kinds = self.kinds
+        pos = self.pos
+        while pos < len(kinds):
+            this_kind = kinds[pos]
+            if this_kind != "COMMENT":
+                if this_kind == kind:
+                    self.pos = pos + 1
+                    return self.tokens[pos]
+                break
+            pos += 1
+        self.pos = pos
         return None
 
     def require(self, kind: str) -> Token: